@@ -1,9 +1,13 @@
 """
 CoinGecko Price Fetcher - CEX aggregated prices
 """
+import asyncio
 import logging
-import aiohttp
-from typing import Dict, Optional
+import time
+from typing import Dict, List, Tuple
+
+from .http_session import PooledSession
+from .price_source import PriceSourceResult
 
 logger = logging.getLogger(__name__)
 
@@ -13,8 +17,15 @@ class CoinGeckoFetcher:
 
     BASE_URL = "https://api.coingecko.com/api/v3"
 
-    # Common token ID mappings
-    TOKEN_IDS = {
+    # Seconds a successful price response is served from memory
+    CACHE_TTL = 15.0
+    CACHE_MAX_ENTRIES = 1024
+
+    # Contract addresses per /simple/token_price request when batching
+    CONTRACT_BATCH_SIZE = 30
+
+    # Common token ID mappings (keys lowercased to match normalized lookups)
+    TOKEN_IDS = {k.lower(): v for k, v in {
         # Ethereum
         "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2": "weth",
         "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48": "usd-coin",
@@ -25,117 +36,240 @@ class CoinGeckoFetcher:
         "0x7Fc66500c84A76Ad7e9c93437bFc5Ac33E2DDaE9": "aave",
         "0x514910771AF9Ca656af840dff83E8264EcF986CA": "chainlink",
         # Add more as needed
-    }
+    }.items()}
+
+    def __init__(self):
+        # Shared HTTP session, created lazily inside the running event loop
+        self._http = PooledSession()
+        # (token_address, vs_currency) -> (fetched_at, price data)
+        self._cache: Dict[Tuple[str, str], Tuple[float, PriceSourceResult]] = {}
+        # Fetches in progress, shared by concurrent callers for the same key
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def close(self):
+        """Close the pooled HTTP session"""
+        await self._http.close()
 
     async def get_token_price(
         self,
         token_address: str,
         vs_currency: str = "usd"
-    ) -> Dict:
+    ) -> PriceSourceResult:
         """
         Get token price from CoinGecko
 
         Args:
-            token_address: Token contract address
+            token_address: Token contract address, lowercase
             vs_currency: Currency to price against (default: usd)
 
         Returns:
-            Dict with price data or error
+            PriceSourceResult with price data or error
         """
-        try:
-            token_address = token_address.lower()
+        key = (token_address, vs_currency)
+
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < self.CACHE_TTL:
+            return cached[1]
+
+        # Join an identical request already in flight instead of issuing another
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._fetch_token_price(token_address, vs_currency))
+            self._inflight[key] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        return await asyncio.shield(inflight)
+
+    async def get_token_prices(
+        self,
+        token_addresses: List[str],
+        vs_currency: str = "usd"
+    ) -> Dict[str, PriceSourceResult]:
+        """
+        Get prices for many tokens with as few CoinGecko requests as possible
+
+        Known tokens share one /simple/price request; the rest are looked up
+        by contract address in chunks fetched concurrently.
+
+        Args:
+            token_addresses: Token contract addresses, lowercase
+            vs_currency: Currency to price against (default: usd)
+
+        Returns:
+            Dict mapping token address to price data or error
+        """
+        results: Dict[str, PriceSourceResult] = {}
+        missing = []
+        now = time.monotonic()
+        for token_address in dict.fromkeys(token_addresses):
+            cached = self._cache.get((token_address, vs_currency))
+            if cached and now - cached[0] < self.CACHE_TTL:
+                results[token_address] = cached[1]
+            else:
+                missing.append(token_address)
 
+        ids_by_address = {a: self.TOKEN_IDS[a] for a in missing if a in self.TOKEN_IDS}
+        contract_addresses = [a for a in missing if a not in ids_by_address]
+
+        tasks = []
+        if ids_by_address:
+            token_ids = list(dict.fromkeys(ids_by_address.values()))
+            tasks.append(self._get_simple_prices(token_ids, vs_currency))
+        for i in range(0, len(contract_addresses), self.CONTRACT_BATCH_SIZE):
+            chunk = contract_addresses[i:i + self.CONTRACT_BATCH_SIZE]
+            tasks.append(self._get_contract_prices(chunk, vs_currency))
+
+        # Token IDs and contract addresses never collide, so one map holds both
+        fetched: Dict[str, PriceSourceResult] = {}
+        for batch in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(batch, Exception):
+                logger.error("CoinGecko batch fetch error: %s", batch)
+                continue
+            fetched.update(batch)
+
+        for token_address in missing:
+            result = fetched.get(ids_by_address.get(token_address, token_address))
+            if result is None:
+                result = PriceSourceResult(
+                    source="coingecko",
+                    price_usd=None,
+                    error="CoinGecko batch request failed"
+                )
+            elif result.price_usd is not None:
+                self._store(token_address, vs_currency, result)
+            results[token_address] = result
+
+        return results
+
+    async def _fetch_token_price(
+        self,
+        token_address: str,
+        vs_currency: str
+    ) -> PriceSourceResult:
+        """Fetch a price from the API and cache it on success"""
+        try:
             # Try to map to CoinGecko ID
             token_id = self.TOKEN_IDS.get(token_address)
 
             if token_id:
                 # Use simple price endpoint for known tokens
-                return await self._get_simple_price(token_id, vs_currency)
+                prices = await self._get_simple_prices([token_id], vs_currency)
+                result = prices[token_id]
             else:
                 # Use contract address lookup for unknown tokens
-                return await self._get_contract_price(token_address, vs_currency)
+                prices = await self._get_contract_prices([token_address], vs_currency)
+                result = prices[token_address]
+
+            if result.price_usd is not None:
+                self._store(token_address, vs_currency, result)
+
+            return result
 
         except Exception as e:
-            logger.error(f"CoinGecko fetch error: {e}")
-            return {
-                "source": "coingecko",
-                "error": str(e),
-                "price_usd": None
-            }
-
-    async def _get_simple_price(
+            logger.error("CoinGecko fetch error: %s", e)
+            return PriceSourceResult(
+                source="coingecko",
+                price_usd=None,
+                error=str(e)
+            )
+
+    def _store(self, token_address: str, vs_currency: str, result: PriceSourceResult):
+        """Cache a price result, evicting the oldest entry when full"""
+        key = (token_address, vs_currency)
+        self._cache.pop(key, None)
+        if len(self._cache) >= self.CACHE_MAX_ENTRIES:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[key] = (time.monotonic(), result)
+
+    async def _get_simple_prices(
         self,
-        token_id: str,
+        token_ids: List[str],
         vs_currency: str
-    ) -> Dict:
-        """Get price using token ID (faster, more reliable)"""
+    ) -> Dict[str, PriceSourceResult]:
+        """Get prices for one or more token IDs in a single request (faster, more reliable)"""
         url = f"{self.BASE_URL}/simple/price"
         params = {
-            "ids": token_id,
+            "ids": ",".join(token_ids),
             "vs_currencies": vs_currency,
             "include_24hr_change": "true",
             "include_market_cap": "true",
             "include_24hr_vol": "true"
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                if response.status == 200:
-                    data = await response.json()
-
-                    if token_id in data and vs_currency in data[token_id]:
-                        token_data = data[token_id]
-                        return {
-                            "source": "coingecko",
-                            "method": "simple_price",
-                            "token_id": token_id,
-                            "price_usd": token_data.get(vs_currency),
-                            "change_24h": token_data.get(f"{vs_currency}_24h_change"),
-                            "market_cap": token_data.get(f"{vs_currency}_market_cap"),
-                            "volume_24h": token_data.get(f"{vs_currency}_24h_vol"),
-                            "confidence": 0.95  # High confidence for known tokens
-                        }
-
-                logger.warning(f"CoinGecko API returned {response.status}")
-                return {
-                    "source": "coingecko",
-                    "error": f"API returned {response.status}",
-                    "price_usd": None
-                }
-
-    async def _get_contract_price(
+        session = await self._http.get_session()
+        async with session.get(url, params=params) as response:
+            if response.status != 200:
+                logger.warning("CoinGecko API returned %d", response.status)
+                error = PriceSourceResult(
+                    source="coingecko",
+                    price_usd=None,
+                    error=f"API returned {response.status}"
+                )
+                return {token_id: error for token_id in token_ids}
+
+            data = await response.json()
+
+        results = {}
+        for token_id in token_ids:
+            token_data = data.get(token_id)
+            if token_data and vs_currency in token_data:
+                results[token_id] = PriceSourceResult(
+                    source="coingecko",
+                    method="simple_price",
+                    price_usd=token_data.get(vs_currency),
+                    change_24h=token_data.get(f"{vs_currency}_24h_change"),
+                    market_cap=token_data.get(f"{vs_currency}_market_cap"),
+                    volume_24h=token_data.get(f"{vs_currency}_24h_vol"),
+                    confidence=0.95,  # High confidence for known tokens
+                    extra={"token_id": token_id}
+                )
+            else:
+                results[token_id] = PriceSourceResult(
+                    source="coingecko",
+                    price_usd=None,
+                    error="Token not found on CoinGecko"
+                )
+
+        return results
+
+    async def _get_contract_prices(
         self,
-        contract_address: str,
+        contract_addresses: List[str],
         vs_currency: str
-    ) -> Dict:
-        """Get price using contract address (for unknown tokens)"""
+    ) -> Dict[str, PriceSourceResult]:
+        """Get prices for one or more contract addresses (for unknown tokens)"""
         # Try Ethereum first (most common)
         url = f"{self.BASE_URL}/simple/token_price/ethereum"
         params = {
-            "contract_addresses": contract_address,
+            "contract_addresses": ",".join(contract_addresses),
             "vs_currencies": vs_currency,
             "include_24hr_change": "true"
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                if response.status == 200:
-                    data = await response.json()
-
-                    if contract_address in data and vs_currency in data[contract_address]:
-                        token_data = data[contract_address]
-                        return {
-                            "source": "coingecko",
-                            "method": "contract_price",
-                            "contract_address": contract_address,
-                            "price_usd": token_data.get(vs_currency),
-                            "change_24h": token_data.get(f"{vs_currency}_24h_change"),
-                            "confidence": 0.85  # Slightly lower confidence for contract lookup
-                        }
+        data = {}
+        session = await self._http.get_session()
+        async with session.get(url, params=params) as response:
+            if response.status == 200:
+                data = await response.json()
 
+        results = {}
+        for contract_address in contract_addresses:
+            token_data = data.get(contract_address)
+            if token_data and vs_currency in token_data:
+                results[contract_address] = PriceSourceResult(
+                    source="coingecko",
+                    method="contract_price",
+                    price_usd=token_data.get(vs_currency),
+                    change_24h=token_data.get(f"{vs_currency}_24h_change"),
+                    confidence=0.85,  # Slightly lower confidence for contract lookup
+                    extra={"contract_address": contract_address}
+                )
+            else:
                 # Token not found on Ethereum, might be on another chain
-                return {
-                    "source": "coingecko",
-                    "error": "Token not found on CoinGecko",
-                    "price_usd": None
-                }
+                results[contract_address] = PriceSourceResult(
+                    source="coingecko",
+                    price_usd=None,
+                    error="Token not found on CoinGecko"
+                )
+
+        return results
@@ -1,13 +1,23 @@
 """
 DEX Price Fetcher - On-chain prices from Uniswap and other DEXs
 """
+import asyncio
 import logging
-from typing import Dict, Optional
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 from web3 import Web3
-from decimal import Decimal
+from web3.contract import Contract
+
+from .coingecko_fetcher import CoinGeckoFetcher
+from .price_source import PriceSourceResult
 
 logger = logging.getLogger(__name__)
 
+# Cached pair state: (contract, {pair token: (its reserve index, quote token)},
+# {priced token: its decimals})
+PairState = Tuple[Contract, Dict[str, Tuple[int, str]], Dict[str, int]]
+
 
 class DEXFetcher:
     """Fetch token prices directly from DEX pools"""
@@ -41,164 +51,306 @@ class DEXFetcher:
         }
     ]
 
+    # ERC20 ABI (decimals only)
+    ERC20_ABI = [
+        {
+            "constant": True,
+            "inputs": [],
+            "name": "decimals",
+            "outputs": [{"name": "", "type": "uint8"}],
+            "type": "function"
+        }
+    ]
+
     # Common stablecoin addresses (for pricing)
     STABLECOINS = {
         "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48": {"symbol": "USDC", "decimals": 6},  # USDC
         "0xdAC17F958D2ee523a2206206994597C13D831ec7": {"symbol": "USDT", "decimals": 6},  # USDT
         "0x6B175474E89094C44Da98b954EedeAC495271d0F": {"symbol": "DAI", "decimals": 18},  # DAI
     }
+    STABLECOIN_DECIMALS_LC = {k.lower(): v["decimals"] for k, v in STABLECOINS.items()}
 
     # WETH address (for ETH pricing)
     WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+    WETH_LC = WETH.lower()
+    WETH_DECIMALS = 18
 
-    def __init__(self, w3_instances: Dict[int, Web3]):
+    # ETH/USD used for WETH-quoted pairs until a live price is fetched
+    DEFAULT_ETH_PRICE = 3000.0
+    # Seconds before the cached ETH/USD price is refreshed in the background
+    ETH_PRICE_TTL = 30.0
+
+    # Pairs whose contract and token ordering are kept in memory
+    PAIR_CACHE_MAX_ENTRIES = 1024
+
+    def __init__(
+        self,
+        w3_instances: Dict[int, Web3],
+        price_fetcher: Optional[CoinGeckoFetcher] = None
+    ):
         """
         Initialize with Web3 instances
 
         Args:
             w3_instances: Dict mapping chain_id to Web3 instance
+            price_fetcher: Optional CoinGecko fetcher used for ETH/USD
         """
         self.w3_instances = w3_instances
+        self.price_fetcher = price_fetcher
+
+        # Cached ETH/USD price, None until the first successful refresh
+        self._eth_price: Optional[float] = None
+        self._eth_checked_at = 0.0
+        self._eth_refresh: Optional[asyncio.Task] = None  # Keeps the background task referenced
+
+        # Pair state keyed by (chain_id, lowercase pair address), least recently
+        # used first. Uniswap V2 pair tokens never change, so only reserves are re-read.
+        self._pairs: OrderedDict[Tuple[int, str], PairState] = OrderedDict()
 
     async def get_token_price(
         self,
         token_address: str,
         chain_id: int,
         pair_address: Optional[str] = None
-    ) -> Dict:
+    ) -> PriceSourceResult:
         """
         Get token price from DEX pool
 
         Args:
-            token_address: Token contract address
+            token_address: Token contract address, lowercase
             chain_id: Blockchain ID
-            pair_address: Optional specific pair address to use
+            pair_address: Optional specific pair address to use, lowercase
 
         Returns:
-            Dict with price data or error
+            PriceSourceResult with price data or error
         """
         try:
             w3 = self.w3_instances.get(chain_id)
             if not w3:
-                return {
-                    "source": "dex",
-                    "error": f"Chain {chain_id} not supported",
-                    "price_usd": None
-                }
-
-            token_address = token_address.lower()
+                return PriceSourceResult(
+                    source="dex",
+                    price_usd=None,
+                    error=f"Chain {chain_id} not supported"
+                )
 
             # If pair address provided, use it directly
             if pair_address:
-                return await self._get_pair_price(w3, token_address, pair_address)
+                return await self._get_pair_price(w3, chain_id, token_address, pair_address)
 
             # Otherwise, this would require finding the best pair
             # For now, return unsupported
-            return {
-                "source": "dex",
-                "error": "Pair address required for DEX pricing",
-                "price_usd": None
-            }
+            return PriceSourceResult(
+                source="dex",
+                price_usd=None,
+                error="Pair address required for DEX pricing"
+            )
 
         except Exception as e:
-            logger.error(f"DEX fetch error: {e}")
-            return {
-                "source": "dex",
-                "error": str(e),
-                "price_usd": None
-            }
+            logger.error("DEX fetch error: %s", e)
+            return PriceSourceResult(
+                source="dex",
+                price_usd=None,
+                error=str(e)
+            )
 
     async def _get_pair_price(
         self,
         w3: Web3,
+        chain_id: int,
         token_address: str,
         pair_address: str
-    ) -> Dict:
+    ) -> PriceSourceResult:
         """Get price from a specific Uniswap V2 style pair"""
+        pair_key = (chain_id, pair_address)
+        pair = self._pairs.get(pair_key)
+        if pair is not None and token_address not in pair[1]:
+            return self._not_in_pair()
+
         try:
-            pair_contract = w3.eth.contract(
-                address=w3.to_checksum_address(pair_address),
-                abi=self.PAIR_ABI
+            # web3 calls are blocking, keep them off the event loop
+            pair, reserves = await asyncio.to_thread(
+                self._sync_read_pair, w3, token_address, pair_address, pair
+            )
+        except Exception as e:
+            logger.error("Pair price fetch error: %s", e)
+            return PriceSourceResult(
+                source="dex",
+                price_usd=None,
+                error=f"Pair fetch failed: {str(e)}"
             )
 
-            # Get reserves
-            reserves = pair_contract.functions.getReserves().call()
-            reserve0 = reserves[0]
-            reserve1 = reserves[1]
-
-            # Get token addresses
-            token0 = pair_contract.functions.token0().call().lower()
-            token1 = pair_contract.functions.token1().call().lower()
-
-            # Determine which token is which
-            if token_address == token0:
-                token_reserve = reserve0
-                quote_reserve = reserve1
-                quote_token = token1
-            elif token_address == token1:
-                token_reserve = reserve1
-                quote_reserve = reserve0
-                quote_token = token0
-            else:
-                return {
-                    "source": "dex",
-                    "error": "Token not in pair",
-                    "price_usd": None
-                }
+        # Only pairs that answered the reads are cached (or refreshed as most recent)
+        self._store_pair(pair_key, pair)
 
-            # Calculate price (quote per token)
-            if token_reserve == 0:
-                return {
-                    "source": "dex",
-                    "error": "Zero liquidity",
-                    "price_usd": None
-                }
+        # Determine which token is which
+        _, sides, token_decimals = pair
+        side = sides.get(token_address)
+        if side is None:
+            return self._not_in_pair()
 
-            # Simple price calculation
-            # price = quote_reserve / token_reserve
-            # This gives price in terms of quote token
-            price_in_quote = Decimal(quote_reserve) / Decimal(token_reserve)
-
-            # Check if quote token is a stablecoin
-            quote_token_lower = quote_token.lower()
-            if quote_token_lower in [k.lower() for k in self.STABLECOINS.keys()]:
-                # Direct USD price
-                price_usd = float(price_in_quote)
-                confidence = 0.90
-
-            elif quote_token_lower == self.WETH.lower():
-                # Price in ETH, need to convert to USD
-                # For now, use rough estimate
-                eth_price = 3000  # TODO: Get actual ETH price
-                price_usd = float(price_in_quote) * eth_price
-                confidence = 0.75  # Lower confidence without actual ETH price
+        token_index, quote_token = side
+        token_reserve = reserves[token_index]
+        quote_reserve = reserves[1 - token_index]
 
+        # Calculate price (quote per token)
+        if token_reserve == 0:
+            return PriceSourceResult(
+                source="dex",
+                price_usd=None,
+                error="Zero liquidity"
+            )
+
+        # Check if quote token is a stablecoin
+        # Pair tokens are cached lowercase, compare directly
+        quote_decimals = self.STABLECOIN_DECIMALS_LC.get(quote_token)
+        if quote_decimals is not None:
+            # Direct USD price
+            usd_per_quote = 1.0
+            confidence = 0.90
+
+        elif quote_token == self.WETH_LC:
+            # Price in ETH, convert with the cached ETH/USD price
+            quote_decimals = self.WETH_DECIMALS
+            self._schedule_eth_refresh()
+            if self._eth_price is not None:
+                usd_per_quote = self._eth_price
+                confidence = 0.85
             else:
-                # Unknown quote token
-                return {
-                    "source": "dex",
-                    "error": "Unknown quote token",
-                    "price_usd": None
-                }
+                usd_per_quote = self.DEFAULT_ETH_PRICE
+                confidence = 0.75  # Lower confidence without actual ETH price
+
+        else:
+            # Unknown quote token
+            return PriceSourceResult(
+                source="dex",
+                price_usd=None,
+                error="Unknown quote token"
+            )
 
-            return {
-                "source": "dex",
-                "method": "uniswap_v2_pair",
+        # Price in quote token: reserve ratio scaled from raw units to whole tokens
+        price_in_quote = (quote_reserve / token_reserve) * 10 ** (
+            token_decimals[token_address] - quote_decimals
+        )
+        price_usd = price_in_quote * usd_per_quote
+
+        return PriceSourceResult(
+            source="dex",
+            method="uniswap_v2_pair",
+            price_usd=price_usd,
+            confidence=confidence,
+            extra={
                 "pair_address": pair_address,
                 "token_address": token_address,
                 "quote_token": quote_token,
-                "price_usd": price_usd,
                 "liquidity": {
                     "token_reserve": int(token_reserve),
                     "quote_reserve": int(quote_reserve)
-                },
-                "confidence": confidence
+                }
             }
+        )
 
+    @staticmethod
+    def _not_in_pair() -> PriceSourceResult:
+        """Error result for a token that is not one of the pair's tokens"""
+        return PriceSourceResult(
+            source="dex",
+            price_usd=None,
+            error="Token not in pair"
+        )
+
+    def _schedule_eth_refresh(self):
+        """
+        Refresh the cached ETH/USD price in the background once it is stale
+
+        Never awaited: lookups use the cached price, or DEFAULT_ETH_PRICE at
+        reduced confidence until the first live price arrives. A failed refresh
+        is retried after ETH_PRICE_TTL like a successful one.
+        """
+        if self.price_fetcher is None:
+            return
+
+        now = time.monotonic()
+        if now - self._eth_checked_at >= self.ETH_PRICE_TTL:
+            self._eth_checked_at = now
+            self._eth_refresh = asyncio.create_task(self._refresh_eth_price())
+
+    async def _refresh_eth_price(self):
+        """Fetch ETH/USD from CoinGecko and update the cache"""
+        try:
+            result = await self.price_fetcher.get_token_price(self.WETH_LC)
         except Exception as e:
-            logger.error(f"Pair price fetch error: {e}")
-            return {
-                "source": "dex",
-                "error": f"Pair fetch failed: {str(e)}",
-                "price_usd": None
-            }
+            logger.warning("ETH price refresh failed: %s", e)
+            return
+
+        if result.price_usd:
+            self._eth_price = result.price_usd
+        else:
+            logger.warning("ETH price refresh failed: %s", result.error)
+
+    def _store_pair(self, pair_key: Tuple[int, str], pair: PairState):
+        """Cache a pair's contract and sides, evicting the least recently used when full"""
+        self._pairs[pair_key] = pair
+        self._pairs.move_to_end(pair_key)
+        if len(self._pairs) > self.PAIR_CACHE_MAX_ENTRIES:
+            self._pairs.popitem(last=False)
+
+    def _token_decimals_call(self, w3: Web3, token_address: str):
+        """ERC20 decimals() call for a token, ready to add to a batch"""
+        token_contract = w3.eth.contract(
+            address=Web3.to_checksum_address(token_address),
+            abi=self.ERC20_ABI
+        )
+        return token_contract.functions.decimals()
+
+    def _sync_read_pair(
+        self,
+        w3: Web3,
+        token_address: str,
+        pair_address: str,
+        pair: Optional[PairState]
+    ) -> Tuple[PairState, Tuple[int, int, int]]:
+        """
+        Blocking pair reads, run in a worker thread
+
+        Anything the cached state lacks (pair tokens, the priced token's
+        decimals) is read alongside the reserves. decimals() is only called
+        once the token is known to be in the pair, so a caller-supplied
+        address that is not an ERC20 cannot fail the pair reads. Cache
+        updates are left to the caller on the event loop, so a new state is
+        returned instead of mutating the cached one.
+
+        Returns:
+            (pair state, reserves)
+        """
+        if pair is None:
+            # First sight of this pair: reserves and tokens in a single batch
+            pair_contract = w3.eth.contract(
+                address=Web3.to_checksum_address(pair_address),
+                abi=self.PAIR_ABI
+            )
+            with w3.batch_requests() as batch:
+                batch.add(pair_contract.functions.getReserves())
+                batch.add(pair_contract.functions.token0())
+                batch.add(pair_contract.functions.token1())
+                reserves, token0, token1 = batch.execute()
+
+            token0 = token0.lower()
+            token1 = token1.lower()
+            sides = {token0: (0, token1), token1: (1, token0)}
+            if token_address not in sides:
+                return (pair_contract, sides, {}), reserves
+
+            decimals = self._token_decimals_call(w3, token_address).call()
+            return (pair_contract, sides, {token_address: decimals}), reserves
+
+        pair_contract, sides, token_decimals = pair
+        if token_address in token_decimals:
+            return pair, pair_contract.functions.getReserves().call()
+
+        # Other side of a known pair priced for the first time
+        with w3.batch_requests() as batch:
+            batch.add(pair_contract.functions.getReserves())
+            batch.add(self._token_decimals_call(w3, token_address))
+            reserves, decimals = batch.execute()
+
+        return (pair_contract, sides, {**token_decimals, token_address: decimals}), reserves
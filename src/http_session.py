@@ -0,0 +1,36 @@
+"""
+Pooled HTTP Session - Lazily created aiohttp session shared across requests
+"""
+import aiohttp
+from typing import Optional
+
+
+class PooledSession:
+    """aiohttp session with keep-alive connection pooling, created on first use"""
+
+    def __init__(self, timeout: float = 10, limit: int = 100, limit_per_host: int = 20):
+        self.timeout = timeout
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        # Created lazily inside the running event loop
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the pooled session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=60
+                )
+            )
+        return self._session
+
+    async def close(self):
+        """Close the pooled session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -3,19 +3,28 @@ Multi-Source Price Oracle - Real-time token prices from multiple sources
 
 x402-enabled microservice for cryptocurrency price aggregation
 """
+import asyncio
+import hashlib
 import logging
 import os
+import re
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, Response
-from pydantic import BaseModel, Field
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from starlette.types import Receive, Scope, Send
 from dotenv import load_dotenv
+import orjson
+from web3 import Web3
 
 from .coingecko_fetcher import CoinGeckoFetcher
+from .dex_fetcher import DEXFetcher
+from .http_session import PooledSession
 from .price_aggregator import PriceAggregator
+from .price_source import PriceSourceResult
 from .x402_middleware_dual import X402Middleware
 
 # Load environment variables
@@ -28,18 +37,30 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class DiscoveryCORSMiddleware(CORSMiddleware):
+    """CORS for browser-facing routes; x402 entrypoints are called by agents, not browsers"""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith("/entrypoints/"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
 # Initialize FastAPI
 app = FastAPI(
     title="Multi-Source Price Oracle",
     description="Real-time token prices aggregated from CoinGecko and on-chain DEXs with confidence scoring",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
 app.add_middleware(
-    CORSMiddleware,
+    DiscoveryCORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
@@ -51,10 +72,16 @@ FREE_MODE = os.getenv("FREE_MODE", "true").lower() == "true"
 PAYMENT_ADDRESS = os.getenv("PAYMENT_ADDRESS", "0x01D11F7e1a46AbFC6092d7be484895D2d505095c")
 PORT = int(os.getenv("PORT", "8000"))
 BASE_URL = os.getenv("BASE_URL", f"http://localhost:{PORT}")
+ETH_RPC_URL = os.getenv("ETH_RPC_URL", "https://eth.llamarpc.com")
 
 # Initialize price fetchers
 coingecko_fetcher = CoinGeckoFetcher()
+dex_fetcher = DEXFetcher(
+    {1: Web3(Web3.HTTPProvider(ETH_RPC_URL, request_kwargs={"timeout": 10}))},
+    price_fetcher=coingecko_fetcher
+)
 price_aggregator = PriceAggregator()
+facilitator_session = PooledSession()
 
 if FREE_MODE:
     logger.warning("Running in FREE MODE - no payment verification")
@@ -63,6 +90,14 @@ else:
 
 logger.info("Price oracle initialized")
 
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled HTTP connections"""
+    await coingecko_fetcher.close()
+    await facilitator_session.close()
+
+
 # x402 Payment Middleware
 payment_address = PAYMENT_ADDRESS
 base_url = BASE_URL.rstrip('/')
@@ -76,24 +111,49 @@ app.add_middleware(
         "https://api.cdp.coinbase.com/platform/v2/x402/facilitator"
     ],
     free_mode=FREE_MODE,
+    http_session=facilitator_session,
 )
 
 
 # Request/Response Models
+ADDRESS_RE = re.compile(r"0[xX][0-9a-fA-F]{40}")
+
+
+def normalize_address(value: str) -> str:
+    """Validate a hex address and return its canonical lowercase form"""
+    if not ADDRESS_RE.fullmatch(value):
+        raise ValueError(f"Invalid address: {value!r} (expected 0x + 40 hex characters)")
+    return value.lower()
+
+
 class PriceRequest(BaseModel):
     """Price query request"""
     token_address: str = Field(..., description="Token contract address")
     chain_id: int = Field(default=1, description="Blockchain ID (default: 1 = Ethereum)")
     vs_currency: str = Field(default="usd", description="Currency to price against (default: usd)")
+    pair_address: Optional[str] = Field(default=None, description="Optional Uniswap V2 style pair to include DEX pricing")
 
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        str_strip_whitespace=True,
+        frozen=True,
+        json_schema_extra={
             "example": {
                 "token_address": "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48",
                 "chain_id": 1,
                 "vs_currency": "usd"
             }
         }
+    )
+
+    @field_validator("token_address")
+    @classmethod
+    def _normalize_token_address(cls, value: str) -> str:
+        return normalize_address(value)
+
+    @field_validator("pair_address")
+    @classmethod
+    def _normalize_pair_address(cls, value: Optional[str]) -> Optional[str]:
+        return normalize_address(value) if value is not None else None
 
 
 class PriceResponse(BaseModel):
@@ -112,11 +172,58 @@ class PriceResponse(BaseModel):
     timestamp: str
 
 
+class BatchPriceRequest(BaseModel):
+    """Batch price query request"""
+    token_addresses: List[str] = Field(..., min_length=1, max_length=100, description="Token contract addresses (max 100)")
+    chain_id: int = Field(default=1, description="Blockchain ID (default: 1 = Ethereum)")
+    vs_currency: str = Field(default="usd", description="Currency to price against (default: usd)")
+
+    model_config = ConfigDict(
+        str_strip_whitespace=True,
+        frozen=True,
+        json_schema_extra={
+            "example": {
+                "token_addresses": [
+                    "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48",
+                    "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+                ],
+                "chain_id": 1,
+                "vs_currency": "usd"
+            }
+        }
+    )
+
+    @field_validator("token_addresses")
+    @classmethod
+    def _normalize_token_addresses(cls, value: List[str]) -> List[str]:
+        return [normalize_address(v) for v in value]
+
+
+class BatchPriceResponse(BaseModel):
+    """Batch price query response"""
+    prices: List[PriceResponse]
+    timestamp: str
+
+
 # API Endpoints
-@app.get("/", response_class=HTMLResponse)
-async def landing_page():
-    """Landing page with metadata"""
-    return """<!DOCTYPE html>
+# Static responses are built once at import; discovery bots hit these constantly
+STATIC_CACHE_HEADERS = {"Cache-Control": "public, max-age=3600"}
+
+
+def _etag(content: bytes) -> str:
+    """Strong ETag for a static response body"""
+    return f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+
+
+def _static_response(request: Request, content: bytes, etag: str, media_type: str) -> Response:
+    """Serve precomputed bytes, answering matching revalidations with 304"""
+    headers = {"ETag": etag, **STATIC_CACHE_HEADERS}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+LANDING_HTML_BYTES = """<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -145,6 +252,9 @@ async def landing_page():
     <div class="endpoint">
         <strong>Main Endpoint:</strong> <code>POST /entrypoints/price-oracle/invoke</code>
     </div>
+    <div class="endpoint">
+        <strong>Batch Endpoint:</strong> <code>POST /entrypoints/price-oracle/batch</code>
+    </div>
     <div class="endpoint">
         <strong>Documentation:</strong> <a href="/docs">/docs</a>
     </div>
@@ -152,31 +262,31 @@ async def landing_page():
         <strong>x402 Metadata:</strong> <a href="/.well-known/x402">/.well-known/x402</a>
     </div>
 </body>
-</html>"""
+</html>""".encode()
+LANDING_ETAG = _etag(LANDING_HTML_BYTES)
 
 
-@app.get("/favicon.ico")
-async def favicon():
-    """Favicon endpoint returning SVG with emoji"""
-    svg = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100">
+@app.get("/", response_class=HTMLResponse)
+async def landing_page(request: Request):
+    """Landing page with metadata"""
+    return _static_response(request, LANDING_HTML_BYTES, LANDING_ETAG, "text/html")
+
+
+FAVICON_SVG_BYTES = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100">
     <text y="80" font-size="80">💰</text>
-</svg>"""
-    return Response(content=svg, media_type="image/svg+xml")
+</svg>""".encode()
+FAVICON_ETAG = _etag(FAVICON_SVG_BYTES)
 
 
-@app.get("/entrypoints/price-oracle/invoke")
-async def price_oracle_get():
-    """GET endpoint returning HTTP 402 with x402 metadata"""
-    headers = {
-        "X-Accepts-Payment": "x402",
-        "X-Payment-Network": "base",
-        "X-Payment-Asset": "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
-        "X-Payment-Amount": "10000",
-        "X-Payment-Address": payment_address,
-        "X-Facilitator-Url": "https://facilitator.daydreams.systems"
-    }
+@app.get("/favicon.ico")
+async def favicon(request: Request):
+    """Favicon endpoint returning SVG with emoji"""
+    return _static_response(request, FAVICON_SVG_BYTES, FAVICON_ETAG, "image/svg+xml")
 
-    metadata = {
+
+def _build_payment_required_metadata() -> dict:
+    """x402 metadata returned by the GET invoke endpoint"""
+    return {
         "x402Version": 1,
         "scheme": "exact",
         "network": "base",
@@ -207,6 +317,11 @@ async def price_oracle_get():
                         "type": "string",
                         "required": False,
                         "description": "Currency to price against (default: usd)"
+                    },
+                    "pair_address": {
+                        "type": "string",
+                        "required": False,
+                        "description": "Optional Uniswap V2 style pair to include DEX pricing"
                     }
                 }
             },
@@ -217,10 +332,26 @@ async def price_oracle_get():
         }
     }
 
+
+PAYMENT_REQUIRED_HEADERS = {
+    "X-Accepts-Payment": "x402",
+    "X-Payment-Network": "base",
+    "X-Payment-Asset": "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
+    "X-Payment-Amount": "10000",
+    "X-Payment-Address": payment_address,
+    "X-Facilitator-Url": "https://facilitator.daydreams.systems"
+}
+
+PAYMENT_REQUIRED_JSON_BYTES = orjson.dumps(_build_payment_required_metadata())
+
+
+@app.get("/entrypoints/price-oracle/invoke")
+async def price_oracle_get():
+    """GET endpoint returning HTTP 402 with x402 metadata"""
     return Response(
-        content=str(metadata),
+        content=PAYMENT_REQUIRED_JSON_BYTES,
         status_code=402,
-        headers=headers,
+        headers=PAYMENT_REQUIRED_HEADERS,
         media_type="application/json"
     )
 
@@ -233,7 +364,7 @@ async def health():
         "service": "price-oracle",
         "version": "1.0.0",
         "free_mode": FREE_MODE,
-        "sources": ["coingecko"]
+        "sources": ["coingecko", "dex"]
     }
 
 
@@ -265,56 +396,129 @@ async def get_token_price(request: PriceRequest):
     """
     try:
         logger.info(
-            f"Fetching price for {request.token_address} on chain {request.chain_id}"
-        )
-
-        # Fetch from CoinGecko
-        coingecko_data = await coingecko_fetcher.get_token_price(
+            "Fetching price for %s on chain %d",
             request.token_address,
-            request.vs_currency
+            request.chain_id
         )
 
-        # Collect all price sources
-        source_prices = [coingecko_data]
+        # Fetch all sources concurrently
+        tasks = [
+            coingecko_fetcher.get_token_price(
+                request.token_address,
+                request.vs_currency
+            )
+        ]
+        if request.pair_address:
+            tasks.append(
+                dex_fetcher.get_token_price(
+                    request.token_address,
+                    request.chain_id,
+                    request.pair_address
+                )
+            )
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Collect all price sources, keeping failures out of the aggregate
+        source_prices = []
+        fetch_warnings = []
+        for source_result in results:
+            if isinstance(source_result, Exception):
+                logger.error("Price source raised: %s", source_result)
+                fetch_warnings.append(f"ℹ️ Price source error: {source_result}")
+            else:
+                source_prices.append(source_result)
+
+        coingecko_data = results[0]
+        if isinstance(coingecko_data, Exception):
+            coingecko_data = PriceSourceResult(source="coingecko", price_usd=None, error=str(coingecko_data))
 
         # Aggregate prices
         result = price_aggregator.aggregate_prices(
             request.token_address,
             request.chain_id,
-            source_prices
+            source_prices,
+            keep_full_sources=True
         )
+        if fetch_warnings:
+            result.warnings = [*result.warnings, *fetch_warnings]
 
         # Add timestamp
         result.timestamp = datetime.utcnow().isoformat() + "Z"
 
         # Extract additional data from CoinGecko
-        change_24h = coingecko_data.get("change_24h")
-        market_cap = coingecko_data.get("market_cap")
-        volume_24h = coingecko_data.get("volume_24h")
-
-        return PriceResponse(
-            token_address=result.token_address,
-            chain_id=result.chain_id,
-            price_usd=result.price_usd,
-            confidence=result.confidence,
-            sources_count=result.sources_count,
-            price_range=result.price_range,
-            change_24h=change_24h,
-            market_cap=market_cap,
-            volume_24h=volume_24h,
-            sources=result.sources,
-            warnings=result.warnings,
-            timestamp=result.timestamp
-        )
+        change_24h = coingecko_data.change_24h
+        market_cap = coingecko_data.market_cap
+        volume_24h = coingecko_data.volume_24h
+
+        # FastAPI validates the payload against PriceResponse
+        return {
+            **result.to_dict(),
+            "change_24h": change_24h,
+            "market_cap": market_cap,
+            "volume_24h": volume_24h
+        }
 
     except Exception as e:
-        logger.error(f"Price fetch error: {e}", exc_info=True)
+        logger.error("Price fetch error: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Price fetch failed: {str(e)}")
 
 
+@app.post(
+    "/entrypoints/price-oracle/batch",
+    response_model=BatchPriceResponse,
+    summary="Get Token Prices (Batch)",
+    description="Get real-time prices for up to 100 tokens in one call (0.01 USDC per token)"
+)
+async def get_token_prices(request: BatchPriceRequest):
+    """
+    Get prices for many tokens at once
+
+    CoinGecko lookups are batched: known tokens share a single request and
+    the rest are fetched by contract address in concurrent chunks. Each
+    entry lists its sources as {source, price_usd} summaries.
+    """
+    try:
+        logger.info(
+            "Fetching batch of %d prices on chain %d",
+            len(request.token_addresses),
+            request.chain_id
+        )
+
+        coingecko_prices = await coingecko_fetcher.get_token_prices(
+            request.token_addresses,
+            request.vs_currency
+        )
+
+        coingecko_results = [coingecko_prices[a] for a in request.token_addresses]
+        results = price_aggregator.aggregate_batch(
+            request.token_addresses,
+            request.chain_id,
+            [[coingecko_data] for coingecko_data in coingecko_results]
+        )
+
+        timestamp = datetime.utcnow().isoformat() + "Z"
+        for result in results:
+            result.timestamp = timestamp
+        prices = [
+            {
+                **result.to_dict(),
+                "change_24h": coingecko_data.change_24h,
+                "market_cap": coingecko_data.market_cap,
+                "volume_24h": coingecko_data.volume_24h
+            }
+            for result, coingecko_data in zip(results, coingecko_results)
+        ]
+
+        return {"prices": prices, "timestamp": timestamp}
+
+    except Exception as e:
+        logger.error("Batch price fetch error: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Batch price fetch failed: {str(e)}")
+
+
 # Agent Discovery Endpoints
-@app.get("/.well-known/agent.json")
-async def agent_metadata():
+def _build_agent_metadata() -> dict:
     """Agent metadata for service discovery"""
     return {
         "name": "Multi-Source Price Oracle",
@@ -346,7 +550,8 @@ async def agent_metadata():
                     "properties": {
                         "token_address": {"type": "string"},
                         "chain_id": {"type": "integer"},
-                        "vs_currency": {"type": "string"}
+                        "vs_currency": {"type": "string"},
+                        "pair_address": {"type": "string"}
                     },
                     "required": ["token_address"]
                 },
@@ -361,6 +566,34 @@ async def agent_metadata():
                     }
                 },
                 "pricing": {"invoke": "0.01 USDC"}
+            },
+            "price-oracle-batch": {
+                "description": "Get real-time prices for up to 100 tokens in one call",
+                "streaming": False,
+                "input_schema": {
+                    "$schema": "https://json-schema.org/draft/2020-12/schema",
+                    "type": "object",
+                    "properties": {
+                        "token_addresses": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "minItems": 1,
+                            "maxItems": 100
+                        },
+                        "chain_id": {"type": "integer"},
+                        "vs_currency": {"type": "string"}
+                    },
+                    "required": ["token_addresses"]
+                },
+                "output_schema": {
+                    "$schema": "https://json-schema.org/draft/2020-12/schema",
+                    "type": "object",
+                    "properties": {
+                        "prices": {"type": "array"},
+                        "timestamp": {"type": "string"}
+                    }
+                },
+                "pricing": {"invoke": "0.01 USDC per token"}
             }
         },
         "payments": [
@@ -378,8 +611,17 @@ async def agent_metadata():
     }
 
 
-@app.get("/.well-known/x402")
-async def x402_metadata():
+AGENT_JSON_BYTES = orjson.dumps(_build_agent_metadata())
+AGENT_JSON_ETAG = _etag(AGENT_JSON_BYTES)
+
+
+@app.get("/.well-known/agent.json")
+async def agent_metadata(request: Request):
+    """Agent metadata for service discovery"""
+    return _static_response(request, AGENT_JSON_BYTES, AGENT_JSON_ETAG, "application/json")
+
+
+def _build_x402_metadata() -> dict:
     """x402 payment metadata"""
     return {
         "x402Version": 1,
@@ -432,11 +674,58 @@ async def x402_metadata():
                     ],
                     "update_frequency": "real_time"
                 }
+            },
+            {
+                "scheme": "exact",
+                "network": "base",
+                "maxAmountRequired": "1000000",  # 0.01 USDC per token, up to 100 tokens
+                "resource": f"{base_url}/entrypoints/price-oracle/batch",
+                "description": "Real-time prices for up to 100 tokens, 0.01 USDC per token",
+                "mimeType": "application/json",
+                "payTo": payment_address,
+                "maxTimeoutSeconds": 15,
+                "asset": "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",  # USDC on Base
+                "outputSchema": {
+                    "input": {
+                        "type": "http",
+                        "method": "POST",
+                        "bodyType": "json",
+                        "bodyFields": {
+                            "token_addresses": {
+                                "type": "array",
+                                "required": True,
+                                "description": "Token contract addresses (max 100)"
+                            },
+                            "chain_id": {
+                                "type": "integer",
+                                "required": False,
+                                "description": "Blockchain ID (default: 1)"
+                            }
+                        }
+                    },
+                    "output": {
+                        "type": "object",
+                        "properties": {
+                            "prices": {"type": "array"},
+                            "timestamp": {"type": "string"}
+                        }
+                    }
+                }
             }
         ]
     }
 
 
+X402_JSON_BYTES = orjson.dumps(_build_x402_metadata())
+X402_JSON_ETAG = _etag(X402_JSON_BYTES)
+
+
+@app.get("/.well-known/x402")
+async def x402_metadata(request: Request):
+    """x402 payment metadata"""
+    return _static_response(request, X402_JSON_BYTES, X402_JSON_ETAG, "application/json")
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=PORT)
+    uvicorn.run(app, host="0.0.0.0", port=PORT, loop="uvloop", http="httptools")
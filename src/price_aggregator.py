@@ -2,14 +2,80 @@
 Price Aggregator - Combines multiple price sources with confidence scoring
 """
 import logging
-from typing import Dict, List
-from statistics import median, stdev
+from typing import Dict, List, Sequence, Tuple
 from dataclasses import dataclass
 
+from .price_source import PriceSourceResult
+
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+def _median_small(values: Sequence[float]) -> float:
+    """Median for the handful of values an aggregate sees, without statistics overhead"""
+    n = len(values)
+    if n == 1:
+        return values[0]
+    if n == 2:
+        return (values[0] + values[1]) / 2
+    if n == 3:
+        a, b, c = values
+        return max(min(a, b), min(max(a, b), c))
+
+    ordered = sorted(values)
+    mid = n // 2
+    if n % 2:
+        return ordered[mid]
+    return (ordered[mid - 1] + ordered[mid]) / 2
+
+
+def _aggregate_kernel(
+    prices: Sequence[float],
+    confidences: Sequence[float],
+    max_spread_pct: float
+) -> Tuple[float, float, float, float, float]:
+    """
+    Core price math over parallel price/confidence sequences (two or more)
+
+    Confidence is higher when multiple sources agree, the spread is low and
+    individual source confidences are high.
+
+    Returns:
+        (final_price, price_min, price_max, spread_pct, confidence)
+    """
+    # Weight each price by its confidence
+    weighted_sum = 0.0
+    total_weight = 0.0
+    price_min = price_max = prices[0]
+    for price, confidence in zip(prices, confidences):
+        weighted_sum += price * confidence
+        total_weight += confidence
+        if price < price_min:
+            price_min = price
+        if price > price_max:
+            price_max = price
+
+    if total_weight > 0:
+        final_price = weighted_sum / total_weight
+    else:
+        final_price = _median_small(prices)  # Fallback to median
+
+    spread_pct = ((price_max - price_min) / final_price) * 100 if final_price > 0 else 0.0
+
+    base_confidence = _median_small(confidences)
+
+    # Multiple sources earn the full +0.2 bonus (0.1 per source, capped at 0.2)
+    source_bonus = 0.2
+
+    # Penalize spread above the acceptable maximum, capped at 0.3
+    spread_penalty = min(max(spread_pct - max_spread_pct, 0.0) / 100, 0.3)
+
+    # Calculate final confidence, clamped between 0.1 and 1.0
+    confidence = max(0.1, min(1.0, base_confidence + source_bonus - spread_penalty))
+
+    return final_price, price_min, price_max, spread_pct, confidence
+
+
+@dataclass(slots=True)
 class PriceResult:
     """Aggregated price result"""
     token_address: str
@@ -17,11 +83,35 @@ class PriceResult:
     price_usd: float
     confidence: float  # 0.0-1.0
     sources_count: int
-    price_range: Dict  # min, max, spread
-    sources: List[Dict]
-    warnings: List[str]
+    price_range: Dict  # min, max, spread (full precision, see to_dict)
+    sources: List[Dict]  # Source summaries, or full source data on request
+    warnings: Sequence[str]
     timestamp: str
 
+    def to_dict(self) -> Dict:
+        """
+        Response fields, rounded for output
+
+        Values are kept at full precision internally; rounding happens only
+        here, at the serialization boundary.
+        """
+        price_range = self.price_range
+        return {
+            "token_address": self.token_address,
+            "chain_id": self.chain_id,
+            "price_usd": round(self.price_usd, 6),
+            "confidence": round(self.confidence, 3),
+            "sources_count": self.sources_count,
+            "price_range": {
+                "min": round(price_range["min"], 6),
+                "max": round(price_range["max"], 6),
+                "spread_percent": round(price_range["spread_percent"], 2)
+            },
+            "sources": self.sources,
+            "warnings": list(self.warnings),  # Shared tuples internally, a list on the wire
+            "timestamp": self.timestamp
+        }
+
 
 class PriceAggregator:
     """Aggregate prices from multiple sources with confidence scoring"""
@@ -29,11 +119,18 @@ class PriceAggregator:
     # Maximum acceptable price spread between sources (%)
     MAX_SPREAD_PCT = 5.0
 
+    # Fixed warning messages
+    WARN_VERY_HIGH_SPREAD = "🚨 VERY HIGH SPREAD - Price may be unreliable or arbitrage opportunity"
+    WARN_SINGLE_SOURCE = "ℹ️ Single price source - confidence reduced"
+    NO_WARNINGS: Tuple[str, ...] = ()
+    _SINGLE_SOURCE_WARNINGS: Tuple[str, ...] = (WARN_SINGLE_SOURCE,)
+
     def aggregate_prices(
         self,
         token_address: str,
         chain_id: int,
-        source_prices: List[Dict]
+        source_prices: List[PriceSourceResult],
+        keep_full_sources: bool = False
     ) -> PriceResult:
         """
         Aggregate prices from multiple sources
@@ -42,15 +139,26 @@ class PriceAggregator:
             token_address: Token contract address
             chain_id: Blockchain ID
             source_prices: List of price data from different sources
+            keep_full_sources: Include each source's full data instead of a
+                {source, price_usd} summary
 
         Returns:
             PriceResult with aggregated price and confidence
         """
-        # Filter out failed sources
-        valid_sources = [
-            s for s in source_prices
-            if s.get("price_usd") is not None and s.get("price_usd") > 0
-        ]
+        # Split valid sources into parallel price/confidence lists for the kernel
+        # (appends bound locally to skip the attribute lookup per source)
+        valid_sources = []
+        prices = []
+        confidences = []
+        add_source = valid_sources.append
+        add_price = prices.append
+        add_confidence = confidences.append
+        for s in source_prices:
+            price = s.price_usd
+            if price is not None and price > 0:
+                add_source(s)
+                add_price(price)
+                add_confidence(s.confidence)
 
         if not valid_sources:
             # No valid prices
@@ -58,28 +166,33 @@ class PriceAggregator:
                 token_address,
                 chain_id,
                 "No valid price sources available",
-                source_prices
+                source_prices,
+                keep_full_sources
             )
 
-        # Extract prices and confidences
-        prices = [s["price_usd"] for s in valid_sources]
-        confidences = [s.get("confidence", 0.5) for s in valid_sources]
+        if len(prices) == 1:
+            # Single source: nothing to weigh or compare, skip the kernel and warning checks
+            price = prices[0]
+            failed = len(source_prices) - 1
+            return PriceResult(
+                token_address=token_address,
+                chain_id=chain_id,
+                price_usd=price,
+                confidence=confidences[0] * 0.8,
+                sources_count=1,
+                price_range={"min": price, "max": price, "spread_percent": 0.0},
+                sources=self._summarize_sources(valid_sources, keep_full_sources),
+                warnings=self._SINGLE_SOURCE_WARNINGS if not failed else [
+                    self.WARN_SINGLE_SOURCE,
+                    self._failed_sources_warning(failed)
+                ],
+                timestamp=""
+            )
 
         # Calculate price statistics
-        if len(prices) == 1:
-            # Single source
-            final_price = prices[0]
-            price_min = prices[0]
-            price_max = prices[0]
-            spread_pct = 0.0
-            confidence = confidences[0] * 0.8  # Reduce confidence for single source
-        else:
-            # Multiple sources - use weighted average or median
-            final_price = self._calculate_weighted_price(prices, confidences)
-            price_min = min(prices)
-            price_max = max(prices)
-            spread_pct = ((price_max - price_min) / final_price) * 100 if final_price > 0 else 0
-            confidence = self._calculate_confidence(prices, confidences, spread_pct)
+        final_price, price_min, price_max, spread_pct, confidence = _aggregate_kernel(
+            prices, confidences, self.MAX_SPREAD_PCT
+        )
 
         # Generate warnings
         warnings = self._generate_warnings(spread_pct, len(valid_sources), len(source_prices))
@@ -87,110 +200,102 @@ class PriceAggregator:
         return PriceResult(
             token_address=token_address,
             chain_id=chain_id,
-            price_usd=round(final_price, 6),
-            confidence=round(confidence, 3),
+            price_usd=final_price,
+            confidence=confidence,
             sources_count=len(valid_sources),
             price_range={
-                "min": round(price_min, 6),
-                "max": round(price_max, 6),
-                "spread_percent": round(spread_pct, 2)
+                "min": price_min,
+                "max": price_max,
+                "spread_percent": spread_pct
             },
-            sources=valid_sources,
+            sources=self._summarize_sources(valid_sources, keep_full_sources),
             warnings=warnings,
             timestamp=""  # Will be set by caller
         )
 
-    def _calculate_weighted_price(
+    def aggregate_batch(
         self,
-        prices: List[float],
-        confidences: List[float]
-    ) -> float:
-        """Calculate weighted average price based on source confidence"""
-        if not prices:
-            return 0.0
-
-        # Weight each price by its confidence
-        weighted_sum = sum(p * c for p, c in zip(prices, confidences))
-        total_weight = sum(confidences)
-
-        if total_weight == 0:
-            return median(prices)  # Fallback to median
-
-        return weighted_sum / total_weight
-
-    def _calculate_confidence(
-        self,
-        prices: List[float],
-        confidences: List[float],
-        spread_pct: float
-    ) -> float:
-        """
-        Calculate overall confidence in the price
-
-        Higher confidence when:
-        - Multiple sources agree
-        - Low price spread
-        - High individual source confidences
+        token_addresses: List[str],
+        chain_id: int,
+        source_prices: List[List[PriceSourceResult]],
+        keep_full_sources: bool = False
+    ) -> List[PriceResult]:
         """
-        base_confidence = median(confidences)
-
-        # Adjust for number of sources
-        source_bonus = min(0.1 * len(prices), 0.2)  # Up to +0.2 for multiple sources
+        Aggregate prices for many tokens in one call
 
-        # Penalize for high spread
-        if spread_pct > self.MAX_SPREAD_PCT:
-            spread_penalty = min((spread_pct - self.MAX_SPREAD_PCT) / 100, 0.3)
-        else:
-            spread_penalty = 0
+        Each token gets a single filter pass and a kernel call.
 
-        # Calculate final confidence
-        confidence = base_confidence + source_bonus - spread_penalty
+        Args:
+            token_addresses: Token contract addresses
+            chain_id: Blockchain ID shared by all tokens
+            source_prices: Per-token lists of source prices, aligned with token_addresses
+            keep_full_sources: Include each source's full data instead of a summary
 
-        return max(0.1, min(1.0, confidence))  # Clamp between 0.1 and 1.0
+        Returns:
+            PriceResult per token, in input order
+        """
+        aggregate = self.aggregate_prices
+        return [
+            aggregate(token_address, chain_id, sources, keep_full_sources)
+            for token_address, sources in zip(token_addresses, source_prices)
+        ]
 
     def _generate_warnings(
         self,
         spread_pct: float,
         valid_sources: int,
         total_sources: int
-    ) -> List[str]:
-        """Generate warnings based on price data quality"""
-        warnings = []
+    ) -> Sequence[str]:
+        """
+        Generate warnings for a multi-source aggregate
+
+        Clean data (the common case) returns a shared empty tuple; the list is
+        only allocated once a warning actually fires.
+        """
+        warnings = None
 
         if spread_pct > self.MAX_SPREAD_PCT:
-            warnings.append(
-                f"⚠️ High price spread: {spread_pct:.1f}% between sources"
-            )
+            warnings = [f"⚠️ High price spread: {spread_pct:.1f}% between sources"]
 
         if spread_pct > 15:
-            warnings.append(
-                "🚨 VERY HIGH SPREAD - Price may be unreliable or arbitrage opportunity"
-            )
-
-        if valid_sources == 1:
-            warnings.append(
-                "ℹ️ Single price source - confidence reduced"
-            )
+            if warnings is None:
+                warnings = []
+            warnings.append(self.WARN_VERY_HIGH_SPREAD)
 
         if valid_sources < total_sources:
-            failed = total_sources - valid_sources
-            warnings.append(
-                f"ℹ️ {failed} source(s) failed to provide price"
-            )
+            if warnings is None:
+                warnings = []
+            warnings.append(self._failed_sources_warning(total_sources - valid_sources))
 
-        if valid_sources == 0:
-            warnings.append(
-                "🚫 No valid price data available"
-            )
+        return self.NO_WARNINGS if warnings is None else warnings
+
+    @staticmethod
+    def _failed_sources_warning(failed: int) -> str:
+        """Warning for sources that returned no usable price"""
+        return f"ℹ️ {failed} source(s) failed to provide price"
 
-        return warnings
+    def _summarize_sources(
+        self,
+        source_prices: List[PriceSourceResult],
+        keep_full_sources: bool
+    ) -> List[Dict]:
+        """Source entries for a result: full data, or just name and price (or error)"""
+        if keep_full_sources:
+            return [s.to_dict() for s in source_prices]
+        return [
+            {"source": s.source, "price_usd": s.price_usd}
+            if s.error is None else
+            {"source": s.source, "error": s.error}
+            for s in source_prices
+        ]
 
     def _create_error_result(
         self,
         token_address: str,
         chain_id: int,
         error_msg: str,
-        source_prices: List[Dict]
+        source_prices: List[PriceSourceResult],
+        keep_full_sources: bool = False
     ) -> PriceResult:
         """Create error result when no valid prices available"""
         return PriceResult(
@@ -200,7 +305,7 @@ class PriceAggregator:
             confidence=0.0,
             sources_count=0,
             price_range={"min": 0, "max": 0, "spread_percent": 0},
-            sources=source_prices,
+            sources=self._summarize_sources(source_prices, keep_full_sources),
             warnings=[f"🚫 {error_msg}"],
             timestamp=""
         )
@@ -0,0 +1,41 @@
+"""
+Price Source Result - Price data reported by a single source
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+# Market fields each method reports; their keys are emitted even when None
+METHOD_MARKET_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "simple_price": ("change_24h", "market_cap", "volume_24h"),
+    "contract_price": ("change_24h",),
+}
+
+
+@dataclass(slots=True, frozen=True)
+class PriceSourceResult:
+    """Price (or error) from one source such as CoinGecko or a DEX pair"""
+    source: str
+    price_usd: Optional[float]
+    confidence: float = 0.5  # 0.0-1.0
+    change_24h: Optional[float] = None
+    market_cap: Optional[float] = None
+    volume_24h: Optional[float] = None
+    error: Optional[str] = None
+    method: Optional[str] = None
+    extra: Optional[Dict] = None  # Source specific details (token_id, pair, liquidity...)
+
+    def to_dict(self) -> Dict:
+        """JSON-friendly dict with the keys the source's method reports"""
+        data = {"source": self.source, "price_usd": self.price_usd}
+        if self.error is not None:
+            data["error"] = self.error
+            return data
+
+        data["confidence"] = self.confidence
+        if self.method is not None:
+            data["method"] = self.method
+        for field in METHOD_MARKET_FIELDS.get(self.method, ()):
+            data[field] = getattr(self, field)
+        if self.extra:
+            data.update(self.extra)
+        return data
@@ -8,10 +8,13 @@ import json
 import base64
 import aiohttp
 from typing import Optional, List, Tuple
+from urllib.parse import urlsplit
 from fastapi import Request, HTTPException
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 
+from .http_session import PooledSession
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,6 +27,39 @@ class X402Middleware(BaseHTTPMiddleware):
     2. Coinbase CDP facilitator (fallback + Bazaar registration)
     """
 
+    # Price per call in USDC base units (6 decimals); batch calls pay it per token
+    PRICE_PER_CALL = 10000  # 0.01 USDC
+    MAX_BATCH_TOKENS = 100
+    BATCH_PATH_SUFFIX = "/batch"
+
+    # Request body fields advertised in 402 responses
+    INVOKE_BODY_FIELDS = {
+        "token_address": {
+            "type": "string",
+            "required": True,
+            "description": "Token contract address"
+        },
+        "chain_id": {
+            "type": "number",
+            "required": False,
+            "description": "Blockchain ID (default: 1 = Ethereum)"
+        },
+        "vs_currency": {
+            "type": "string",
+            "required": False,
+            "description": "Currency to price against (default: usd)"
+        }
+    }
+    BATCH_BODY_FIELDS = {
+        "token_addresses": {
+            "type": "array",
+            "required": True,
+            "description": "Token contract addresses (max 100, 0.01 USDC each)"
+        },
+        "chain_id": INVOKE_BODY_FIELDS["chain_id"],
+        "vs_currency": INVOKE_BODY_FIELDS["vs_currency"]
+    }
+
     def __init__(
         self,
         app,
@@ -31,6 +67,7 @@ class X402Middleware(BaseHTTPMiddleware):
         base_url: str,
         facilitator_urls: List[str] = None,
         free_mode: bool = False,
+        http_session: Optional[PooledSession] = None,
     ):
         super().__init__(app)
         self.payment_address = payment_address
@@ -46,7 +83,10 @@ class X402Middleware(BaseHTTPMiddleware):
         else:
             self.facilitator_urls = facilitator_urls
 
-        logger.info(f"x402 Middleware initialized (FREE_MODE={free_mode}, facilitators={self.facilitator_urls})")
+        # Pooled HTTP session for facilitator calls; pass one in to own its lifetime
+        self.http_session = http_session if http_session is not None else PooledSession()
+
+        logger.info("x402 Middleware initialized (FREE_MODE=%s, facilitators=%s)", free_mode, self.facilitator_urls)
 
     async def verify_payment_with_facilitator(
         self,
@@ -84,33 +124,32 @@ class X402Middleware(BaseHTTPMiddleware):
             }
 
             # Call facilitator /verify endpoint
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{facilitator_url}/verify",
-                    json=verification_request,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.debug(f"Facilitator {facilitator_url} returned {response.status}: {error_text}")
-                        return False, f"Payment verification failed: {error_text}", None
-
-                    result = await response.json()
-
-                    if result.get("isValid"):
-                        facilitator_name = facilitator_url.split("//")[1].split("/")[0]
-                        logger.info(f"Payment verified via {facilitator_name} for payer: {result.get('payer')}")
-                        return True, None, facilitator_name
-                    else:
-                        reason = result.get("invalidReason", "Unknown reason")
-                        logger.debug(f"Payment invalid at {facilitator_url}: {reason}")
-                        return False, reason, None
+            session = await self.http_session.get_session()
+            async with session.post(
+                f"{facilitator_url}/verify",
+                json=verification_request
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.debug("Facilitator %s returned %d: %s", facilitator_url, response.status, error_text)
+                    return False, f"Payment verification failed: {error_text}", None
+
+                result = await response.json()
+
+                if result.get("isValid"):
+                    facilitator_name = facilitator_url.split("//")[1].split("/")[0]
+                    logger.info("Payment verified via %s for payer: %s", facilitator_name, result.get("payer"))
+                    return True, None, facilitator_name
+                else:
+                    reason = result.get("invalidReason", "Unknown reason")
+                    logger.debug("Payment invalid at %s: %s", facilitator_url, reason)
+                    return False, reason, None
 
         except aiohttp.ClientError as e:
-            logger.debug(f"Facilitator {facilitator_url} connection error: {str(e)}")
+            logger.debug("Facilitator %s connection error: %s", facilitator_url, e)
             return False, f"Facilitator unavailable: {str(e)}", None
         except Exception as e:
-            logger.debug(f"Payment verification error with {facilitator_url}: {str(e)}")
+            logger.debug("Payment verification error with %s: %s", facilitator_url, e)
             return False, f"Verification error: {str(e)}", None
 
     async def verify_payment(
@@ -142,54 +181,60 @@ class X402Middleware(BaseHTTPMiddleware):
             last_error = error_message
 
         # All facilitators failed
-        logger.warning(f"Payment verification failed with all facilitators. Last error: {last_error}")
+        logger.warning("Payment verification failed with all facilitators. Last error: %s", last_error)
         return False, last_error
 
-    def create_402_response(self, resource_url: str, description: str) -> JSONResponse:
+    async def amount_required(self, request: Request) -> str:
+        """
+        Amount charged for a paid request, in USDC base units
+
+        Batch requests pay per requested token (clamped to 1..MAX_BATCH_TOKENS),
+        so a batch costs the same as the single calls it replaces. Bodies whose
+        token count cannot be read are charged the maximum; request validation
+        rejects them after payment anyway.
+        """
+        if not request.url.path.endswith(self.BATCH_PATH_SUFFIX):
+            return str(self.PRICE_PER_CALL)
+
+        try:
+            token_addresses = json.loads(await request.body())["token_addresses"]
+            token_count = len(token_addresses) if isinstance(token_addresses, list) else self.MAX_BATCH_TOKENS
+        except Exception:
+            token_count = self.MAX_BATCH_TOKENS
+        return str(self.PRICE_PER_CALL * min(max(token_count, 1), self.MAX_BATCH_TOKENS))
+
+    def payment_requirements(self, resource_url: str, description: str, amount_required: str) -> dict:
+        """x402 payment requirements for a resource, as listed in 402 responses"""
+        is_batch = urlsplit(resource_url).path.endswith(self.BATCH_PATH_SUFFIX)
+        return {
+            "scheme": "exact",
+            "network": "base",
+            "maxAmountRequired": amount_required,
+            "resource": resource_url,
+            "description": description,
+            "mimeType": "application/json",
+            "payTo": self.payment_address,
+            "maxTimeoutSeconds": 30,
+            "asset": "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",  # USDC on Base
+            "outputSchema": {
+                "input": {
+                    "type": "http",
+                    "method": "POST",
+                    "bodyType": "json",
+                    "bodyFields": self.BATCH_BODY_FIELDS if is_batch else self.INVOKE_BODY_FIELDS
+                },
+                "output": {
+                    "type": "object",
+                    "description": "Token price data with confidence scoring and multi-source aggregation"
+                }
+            }
+        }
+
+    def create_402_response(self, resource_url: str, description: str, amount_required: str) -> JSONResponse:
         """Create HTTP 402 Payment Required response"""
         metadata = {
             "x402Version": 1,
-            "accepts": [
-                {
-                    "scheme": "exact",
-                    "network": "base",
-                    "maxAmountRequired": "10000",  # 0.01 USDC (6 decimals)
-                    "resource": resource_url,
-                    "description": description,
-                    "mimeType": "application/json",
-                    "payTo": self.payment_address,
-                    "maxTimeoutSeconds": 30,
-                    "asset": "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",  # USDC on Base
-                    "outputSchema": {
-                        "input": {
-                            "type": "http",
-                            "method": "POST",
-                            "bodyType": "json",
-                            "bodyFields": {
-                                "token_address": {
-                                    "type": "string",
-                                    "required": True,
-                                    "description": "Token contract address"
-                                },
-                                "chain_id": {
-                                    "type": "number",
-                                    "required": False,
-                                    "description": "Blockchain ID (default: 1 = Ethereum)"
-                                },
-                                "vs_currency": {
-                                    "type": "string",
-                                    "required": False,
-                                    "description": "Currency to price against (default: usd)"
-                                }
-                            }
-                        },
-                        "output": {
-                            "type": "object",
-                            "description": "Token price data with confidence scoring and multi-source aggregation"
-                        }
-                    }
-                }
-            ]
+            "accepts": [self.payment_requirements(resource_url, description, amount_required)]
         }
         return JSONResponse(content=metadata, status_code=402)
 
@@ -218,73 +263,42 @@ class X402Middleware(BaseHTTPMiddleware):
             # Allow GET requests through (they're for discovery/metadata)
             return await call_next(request)
 
+        amount_required = await self.amount_required(request)
+
         # Check for X-Payment header
         payment_header = request.headers.get("X-Payment")
 
         if not payment_header:
-            logger.info(f"Payment required for {request.url.path}, no X-Payment header provided")
+            logger.info("Payment required for %s, no X-Payment header provided", request.url.path)
             return self.create_402_response(
                 resource_url=str(request.url),
-                description="Payment required to access this resource"
+                description="Payment required to access this resource",
+                amount_required=amount_required
             )
 
         # Verify payment via facilitators
         is_valid, error_message = await self.verify_payment(
             payment_header=payment_header,
             resource_url=str(request.url),
-            amount_required="10000"  # 0.01 USDC
+            amount_required=amount_required
         )
 
         if not is_valid:
-            logger.warning(f"Payment verification failed: {error_message}")
+            logger.warning("Payment verification failed: %s", error_message)
             return JSONResponse(
                 status_code=402,
                 content={
                     "error": "Payment verification failed",
                     "message": error_message,
                     "x402Version": 1,
-                    "accepts": [{
-                        "scheme": "exact",
-                        "network": "base",
-                        "maxAmountRequired": "10000",
-                        "resource": str(request.url),
-                        "description": "Payment required to access this resource",
-                        "mimeType": "application/json",
-                        "payTo": self.payment_address,
-                        "maxTimeoutSeconds": 30,
-                        "asset": "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
-                        "outputSchema": {
-                            "input": {
-                                "type": "http",
-                                "method": "POST",
-                                "bodyType": "json",
-                                "bodyFields": {
-                                    "token_address": {
-                                        "type": "string",
-                                        "required": True,
-                                        "description": "Token contract address"
-                                    },
-                                    "chain_id": {
-                                        "type": "number",
-                                        "required": False,
-                                        "description": "Blockchain ID (default: 1 = Ethereum)"
-                                    },
-                                    "vs_currency": {
-                                        "type": "string",
-                                        "required": False,
-                                        "description": "Currency to price against (default: usd)"
-                                    }
-                                }
-                            },
-                            "output": {
-                                "type": "object",
-                                "description": "Token price data with confidence scoring and multi-source aggregation"
-                            }
-                        }
-                    }]
+                    "accepts": [self.payment_requirements(
+                        str(request.url),
+                        "Payment required to access this resource",
+                        amount_required
+                    )]
                 }
             )
 
         # Payment verified, proceed with request
-        logger.info(f"Payment verified, processing request to {request.url.path}")
+        logger.info("Payment verified, processing request to %s", request.url.path)
         return await call_next(request)